@@ -19,6 +19,8 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
 from sys import version_info
 from textwrap import wrap
 
@@ -56,6 +58,35 @@ def get_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "local_dir", type=str, help="Directory to search for existing files in",
     )
+    parser.add_argument(
+        "-R",
+        "--extra-remote-dir",
+        action="append",
+        dest="extra_remote_dirs",
+        metavar="<remote-dir>",
+        help="Another directory to clone from the remote server over the same "
+        "connection (may be given multiple times). Each remote directory is cloned "
+        "into a directory with the same name in <out-dir>",
+    )
+    parser.add_argument(
+        "-L",
+        "--extra-local-dir",
+        action="append",
+        dest="extra_local_dirs",
+        metavar="<local-dir>",
+        help="Another directory to search for existing files in (may be given "
+        "multiple times). Files in earlier directories are used first",
+    )
+    parser.add_argument(
+        "-t",
+        "--target",
+        action="append",
+        dest="targets",
+        metavar="<host:remote-dir>",
+        help="Another host and directory to clone from it (may be given multiple "
+        "times). Hosts are connected to and cloned concurrently, matching against the "
+        "same local files, and each host is cloned into <out-dir>/<host>",
+    )
     parser.add_argument(
         "-u",
         "--username",
@@ -145,6 +176,15 @@ def get_parser() -> argparse.ArgumentParser:
         help="Function for hashing files on the remote server (default SHA1)",
         metavar="<algorithm>",
     )
+    parser.add_argument(
+        "-w",
+        "--remote-workers",
+        type=int,
+        default=0,
+        metavar="<workers>",
+        help="Maximum number of processes to use for hashing files on the remote "
+        "server (default one per CPU on the server)",
+    )
     parser.add_argument(
         "-n",
         "--force-newer",
@@ -158,6 +198,34 @@ def get_parser() -> argparse.ArgumentParser:
         default="stdout",
         help='File to log to or "stdout" or "stderr"',
     )
+    unmatched_group = parser.add_mutually_exclusive_group()
+    unmatched_group.add_argument(
+        "--fetch",
+        action="store_true",
+        help="Download remote files that don't match any local file into the output "
+        "directory (so rsync isn't needed afterwards)",
+    )
+    parser.add_argument(
+        "--fetch-workers",
+        type=int,
+        default=8,
+        metavar="<workers>",
+        help="Number of files to download at once with --fetch (default 8)",
+    )
+    unmatched_group.add_argument(
+        "--seed",
+        action="store_true",
+        help="Copy the most similar local file (by comparing blocks on both machines) "
+        "to the location of each remote file that doesn't match any local file, so "
+        "that rsync only has to transfer the differences",
+    )
+    parser.add_argument(
+        "--seed-block-size",
+        type=int,
+        default=2 ** 16,
+        metavar="<bytes>",
+        help="Size of the blocks compared with --seed (default 65536)",
+    )
     parser.add_argument(
         "--req-existing-hostkey",
         action="store_true",
@@ -172,6 +240,49 @@ def get_parser() -> argparse.ArgumentParser:
     return parser
 
 
+def get_host_args(args: argparse.Namespace) -> list:
+    """
+    Returns a list of the keyword arguments for the FileFinder for each host in args
+    (the host argument and the host of each --target)
+    :raises ValueError if one of the targets is invalid
+    """
+    kwargs = vars(args).copy()
+    targets = kwargs.pop("targets") or []
+    if not targets:
+        return [kwargs]
+    # Dict of host -> remote directories to clone from it
+    hosts = {args.host: [args.remote_dir] + (args.extra_remote_dirs or [])}
+    for target in targets:
+        if ":/" not in target:
+            raise ValueError(
+                "Invalid target " + target + " (should be of the form host:/dir)"
+            )
+        host, remote_dir = target.split(":/", 1)
+        hosts.setdefault(host, []).append("/" + remote_dir)
+    host_args = []
+    for host, remote_dirs in hosts.items():
+        host_kwargs = kwargs.copy()
+        host_kwargs["host"] = host
+        host_kwargs["remote_dir"] = remote_dirs[0]
+        host_kwargs["extra_remote_dirs"] = remote_dirs[1:]
+        host_kwargs["out_dir"] = os.path.join(
+            args.out_dir or os.path.curdir, host.replace(":", "_")
+        )
+        host_args.append(host_kwargs)
+    return host_args
+
+
+def connect(kwargs: dict):
+    """
+    Returns a FileFinder created with kwargs or the error message if it couldn't be
+    created
+    """
+    try:
+        return FileFinder(**kwargs)
+    except ValueError as e:
+        return "Error ({}): {}".format(kwargs["host"], e)
+
+
 def run():
     parser = get_parser()
     if version_info[1] < 7:
@@ -179,11 +290,27 @@ def run():
     else:
         args = parser.parse_intermixed_args()
     try:
-        file_finder = FileFinder(**vars(args))
+        host_args = get_host_args(args)
     except ValueError as e:
         print("Error: {}".format(e))
         return
-    if file_finder.run():
+    if len(host_args) == 1:
+        try:
+            file_finder = FileFinder(**host_args[0])
+        except ValueError as e:
+            print("Error: {}".format(e))
+            return
+        success = file_finder.run()
+    else:
+        # Connect to all of the hosts at once
+        with ThreadPoolExecutor(len(host_args)) as executor:
+            file_finders = list(executor.map(connect, host_args))
+        errors = [f for f in file_finders if isinstance(f, str)]
+        if errors:
+            print("\n".join(errors))
+            return
+        success = FileFinder.run_all(file_finders)
+    if success:
         print("Done")
     else:
         print("An error occurred. No files have been modfied")
@@ -16,21 +16,42 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import bisect
 import errno
 import hashlib
 import os.path
 import shutil
 import subprocess
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from ast import literal_eval
 from getpass import getpass
 from io import BytesIO
 from socket import gaierror
 from types import MethodType
-from typing import Callable, Dict, List, Optional, Set, Tuple
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
 
 import paramiko
 
+from remote_script import block_signatures, encode_sizes
+
+# Max #local files to compare each unmatched remote file against when seeding
+SEED_CANDIDATES = 4
+# Length of each block signature returned by block_signatures
+SIGNATURE_LENGTH = 16
+
+
+class RemoteStat(NamedTuple):
+    """
+    The attributes of a remote file that fef uses
+    """
+
+    st_size: int
+    st_mtime: float
+    st_atime: float
+    st_mode: int
+
 
 class FileFinder:
     def __init__(
@@ -48,11 +69,18 @@ class FileFinder:
         verbosity: bool,
         clean: bool,
         hash_function: str,
+        remote_workers: int,
         copy: bool,
         req_existing_hostkey: bool,
         no_local_keys: bool,
         force_newer: bool,
         log_file: str,
+        fetch: bool,
+        fetch_workers: int,
+        seed: bool,
+        seed_block_size: int,
+        extra_local_dirs: List[str],
+        extra_remote_dirs: List[str],
     ):
         """
         Initialize class attributes, prompting the user for a password if required,
@@ -92,39 +120,48 @@ class FileFinder:
         if not hasattr(self, "port"):
             self.port = 22
 
-        if not os.path.isdir(local_dir):
-            raise ValueError("Local directory " + local_dir + " doesn't exist")
-        self.local_path = os.path.abspath(local_dir)
-        if self.local_path[-1] != os.path.sep:
-            self.local_path += os.path.sep
-
-        """Remote directory (to be validated on connecting)"""
+        """Local directories (in order of priority)"""
+        self.local_paths = []
+        for directory in [local_dir] + (extra_local_dirs or []):
+            if not os.path.isdir(directory):
+                raise ValueError("Local directory " + directory + " doesn't exist")
+            path = os.path.abspath(directory)
+            if path[-1] != os.path.sep:
+                path += os.path.sep
+            self.local_paths.append(path)
+        self.local_path = self.local_paths[0]
+
+        """Remote directories (to be validated on connecting)"""
+        self.remote_paths = [remote_dir] + (extra_remote_dirs or [])
         self.remote_path = remote_dir
 
-        """Out dir"""
+        """Out dirs"""
         # TODO allow continuing even if output directory already exists
-        if out_dir:
-            if os.path.isdir(out_dir):
+        # Dict of remote directory -> local directory to clone it into
+        self.out_paths = {}
+        for remote in self.remote_paths:
+            if out_dir and len(self.remote_paths) == 1:
+                out_path = os.path.abspath(out_dir)
+            else:
+                # Each remote directory is cloned into a directory with the same name
+                # in the output directory (or the current directory)
+                remote_top_dir = os.path.basename(remote.rstrip("/"))
+                if not remote_top_dir:
+                    raise ValueError("Invalid remote file path " + remote)
+                out_path = os.path.abspath(
+                    os.path.join(out_dir or os.path.curdir, remote_top_dir)
+                )
+            if out_path in self.out_paths.values():
                 raise ValueError(
-                    "Directory " + os.path.abspath(out_dir) + " already exists."
-                    " Move it or specify an output path with -o"
+                    "Multiple remote directories would be cloned into " + out_path
                 )
-            self.out_path = os.path.abspath(out_dir)
-        else:
-            split_remote_dir = remote_dir.split("/")
-            if len(split_remote_dir) < 2:
-                raise ValueError("Invalid remote file path " + remote_dir)
-            remote_top_dir = split_remote_dir[-2]
-            if os.path.exists(os.path.join(os.path.curdir, remote_top_dir)):
+            if os.path.exists(out_path):
                 raise ValueError(
-                    "Directory "
-                    + os.path.join(os.path.curdir, remote_top_dir)
-                    + " already exists."
+                    "Directory " + out_path + " already exists."
                     " Move it or specify an output path with -o"
                 )
-            self.out_path = os.path.abspath(
-                os.path.join(os.path.curdir, remote_top_dir)
-            )
+            self.out_paths[remote] = out_path
+        self.out_path = self.out_paths[self.remote_path]
 
         """Link options (hard/soft)"""
         self.symlink = symlinks
@@ -173,21 +210,39 @@ class FileFinder:
         self.use_local_keys = not no_local_keys
         self.existing_hostkey = req_existing_hostkey
         self.force_newer = force_newer
+        # Whether to download remote files that aren't matched and how many
+        # downloads to run at once
+        if fetch_workers < 1:
+            raise ValueError("Number of fetch workers must be at least 1")
+        self.fetch = fetch
+        self.fetch_workers = fetch_workers
+        # Whether to copy the most similar local file to the location of remote files
+        # that aren't matched and the block size to compare files with
+        if seed_block_size < 1:
+            raise ValueError("Seed block size must be at least 1")
+        self.seed = seed
+        self.seed_block_size = seed_block_size
         # TODO add option to set these
         # Max #bytes of file to read into memory at once
         self.read_size = 2 ** 16  # 64k
         self.remote_read_size = 2 ** 16  # 64k
+        # Max #processes to hash with on the remote server (0 for one per CPU)
+        if remote_workers < 0:
+            raise ValueError("Number of remote workers must not be negative")
+        self.remote_workers = remote_workers
 
         """Connect to the remote server"""
         connect_result = self.connect()
         if connect_result:
             raise ValueError(connect_result)
-        try:
-            self.sftp.chdir(self.remote_path)
-        except IOError:
-            raise ValueError(
-                'Directory "' + self.remote_path + "\" doesn't exist on the server"
-            )
+        for remote in self.remote_paths:
+            try:
+                self.sftp.stat(remote)
+            except IOError:
+                raise ValueError(
+                    'Directory "' + remote + "\" doesn't exist on the server"
+                )
+        self.sftp.chdir(self.remote_path)
         # Check that both machines support the hash function
         supported = self.remote_supported_hash_functions()
         if self.hash_method not in supported:
@@ -203,10 +258,6 @@ class FileFinder:
 
         # Make hashing script if possible
         self.remote_hash_script = self.create_hash_script()
-        if self.remote_hash_script is None:
-            self.remote_hash = self.remote_hash_command_line
-        else:
-            self.set_remote_hash_function_to_script(self.remote_hash_script)
 
         """Dicts for tracking local file hashes"""
         # Dict of filesize->paths for all files of a certain size
@@ -217,25 +268,44 @@ class FileFinder:
         # Dict of path->hash which stores the actual hashes for each file
         # (computed ad hoc during self.run())
         self.file_hashes = {}
+        # Set of local files that have been matched with a remote file (so they aren't
+        # matched with another one)
+        self.matched_local_files = set()
+        # Whether file_sizes and file_hashes are shared with FileFinders for other
+        # hosts (see run_all) so they shouldn't be recomputed by self.run()
+        self.shared_local_index = False
+        # Lock held while moving files (shared with FileFinders for other hosts)
+        self.move_lock = threading.Lock()
 
     def generate_filesize_map(self) -> Dict[int, List[str]]:
+        """
+        Returns a dict of size -> paths of all files of that size in the local
+        directories, where the paths are in the order of the local directories
+        """
         sizes = {}
-        for root, _, files in os.walk(self.local_path):
-            for file in files:
-                size = os.path.getsize(os.path.join(root, file))
-                if size in sizes:
-                    sizes[size].append(os.path.join(root, file))
-                else:
-                    sizes[size] = [os.path.join(root, file)]
+        seen = set()
+        for local_path in self.local_paths:
+            for root, _, files in os.walk(local_path):
+                for file in files:
+                    path = os.path.join(root, file)
+                    # Local directories may be inside each other
+                    if path in seen:
+                        continue
+                    seen.add(path)
+                    size = os.path.getsize(path)
+                    if size in sizes:
+                        sizes[size].append(path)
+                    else:
+                        sizes[size] = [path]
         return sizes
 
     def set_local_hash_func(self, hash_function: Callable) -> None:
         """
-        Sets self.local_hash to a unary function that opens a file and
-        hashes its contents with hash_function
+        Sets self.hash_local_file to a unary function that opens a file and
+        hashes its contents with hash_function (which self.local_hash caches)
         """
         # Create hash function
-        def local_hash(self, filename: str) -> str:
+        def hash_local_file(self, filename: str) -> str:
             hasher = hash_function()
             with open(filename, "rb") as file:
                 while True:
@@ -244,8 +314,8 @@ class FileFinder:
                         return hasher.hexdigest()
                     hasher.update(data)
 
-        # Bind function to this self.local_hash
-        self.local_hash = MethodType(local_hash, self)
+        # Bind function to this self.hash_local_file
+        self.hash_local_file = MethodType(hash_local_file, self)
 
     def remote_path_join(self, *parts) -> str:
         """Joins parts using the remote's path separator"""
@@ -309,20 +379,11 @@ print(algorithms_available)" """
     def get_hash_script_body(self) -> str:
         """
         Returns a string of the contents of the hash script file to put
-        on the remote server
+        on the remote server (which is the contents of remote_script.py)
         """
-        return """from hashlib import {}
-from sys import argv
-hasher = {}()
-with open(argv[1], 'rb') as file:
-    while True:
-        data = file.read({})
-        if not data:
-            print(hasher.hexdigest())
-            break
-        hasher.update(data)""".format(
-            self.hash_method, self.hash_method, self.remote_read_size,
-        )
+        script_path = os.path.join(os.path.dirname(__file__), "remote_script.py")
+        with open(script_path) as file:
+            return file.read()
 
     def connect(self) -> Optional[str]:
         """
@@ -388,22 +449,72 @@ with open(argv[1], 'rb') as file:
         except gaierror as e:
             return str(e) + " (" + self.hostname + ")"
         self.sftp = self.ssh.open_sftp()
-        # Check that self.remote_path is valid and readable
-        try:
-            self.sftp.stat(self.remote_path)
-        except IOError as e:
-            return str(e)
 
-    def set_remote_hash_function_to_script(self, script_remote_path: str) -> None:
-        # Create hash function
-        def remote_hash(self, filename: str) -> str:
-            _, result, _ = self.ssh.exec_command(
-                "python3 " + script_remote_path + " " + filename
+    def remote_hash_many(self, paths: List[str]) -> Iterator[Tuple[str, str]]:
+        """
+        Hash the files at paths on the remote server, yielding (path, hash) for each
+        file as soon as its hash is received (in no particular order)
+        If the hash script exists then all of the files are hashed by a single run of
+        the script using up to self.remote_workers processes, otherwise each file is
+        hashed separately with self.remote_hash_command_line
+        Files that can't be hashed are yielded with a hash of None
+        """
+        if self.remote_hash_script is None:
+            for path in paths:
+                yield path, self.remote_hash_command_line(path)
+            return
+        yield from self.run_remote_script(
+            paths, "hash", self.hash_method, self.remote_read_size
+        )
+
+    def run_remote_script(
+        self, paths: List[str], mode: str, *args
+    ) -> Iterator[Tuple[str, Optional[str]]]:
+        """
+        Run the hash script in mode (with arguments args) on all of paths using up to
+        self.remote_workers processes, yielding (path, result) for each path as soon
+        as its result is received (in no particular order)
+        Paths that couldn't be processed are yielded with a result of None
+        """
+        stdin, stdout, _ = self.ssh.exec_command(
+            "python3 {} {} {} {}".format(
+                self.remote_hash_script,
+                mode,
+                self.remote_workers,
+                " ".join(str(arg) for arg in args),
             )
-            return result.read().decode().lstrip().rstrip()
+        )
 
-        # Bind function to self.remote_hash
-        self.remote_hash = MethodType(remote_hash, self)
+        # Send the paths from another thread so that the server is never blocked
+        # writing results that we aren't reading yet
+        def send_paths():
+            for path in paths:
+                stdin.write(path.encode() + b"\0")
+            # Empty path marks the end of the list
+            stdin.write(b"\0")
+            stdin.channel.shutdown_write()
+
+        sender = threading.Thread(target=send_paths, daemon=True)
+        sender.start()
+        yield from self.read_script_records(stdout)
+        sender.join()
+
+    def read_script_records(self, stdout) -> Iterator[Tuple[str, Optional[str]]]:
+        """
+        Yields (path, result) for each "<result>\t<path>\0" record written by the
+        hash script to stdout as soon as it is received
+        Paths that couldn't be processed (with a result of "-") have a result of None
+        """
+        buffer = b""
+        while True:
+            data = stdout.channel.recv(self.remote_read_size)
+            if not data:
+                break
+            buffer += data
+            *records, buffer = buffer.split(b"\0")
+            for record in records:
+                result, path = record.split(b"\t", 1)
+                yield path.decode(), None if result == b"-" else result.decode()
 
     def run(self) -> bool:
         """
@@ -412,36 +523,92 @@ with open(argv[1], 'rb') as file:
         On failure, prints error messages and returns False
         """
 
-        self.file_sizes = self.generate_filesize_map()
-        self.file_hashes = {}
+        if not self.shared_local_index:
+            self.file_sizes = self.generate_filesize_map()
+            self.file_hashes = {}
+        self.matched_local_files = set()
 
-        remote_files = self.get_remote_filenames()
+        for remote_path in self.remote_paths:
+            self.clone_remote_dir(remote_path)
+
+        """Clean up"""
+        # Remove hash script from remote
+        if self.remote_hash_script is not None:
+            self.sftp.remove(self.remote_hash_script)
+        return True
+
+    @staticmethod
+    def run_all(file_finders: List["FileFinder"]) -> bool:
+        """
+        Run file_finders (which should be for different hosts but have the same local
+        directories) concurrently, building the local file size map once and sharing
+        it and the local file hashes between them
+        Returns True if all of them succeed
+        """
+        first = file_finders[0]
+        first.file_sizes = first.generate_filesize_map()
+        first.file_hashes = {}
+        for file_finder in file_finders:
+            file_finder.file_sizes = first.file_sizes
+            file_finder.file_hashes = first.file_hashes
+            file_finder.move_lock = first.move_lock
+            file_finder.shared_local_index = True
+        with ThreadPoolExecutor(len(file_finders)) as executor:
+            results = list(executor.map(FileFinder.run, file_finders))
+        return all(results)
+
+    def clone_remote_dir(self, remote_path: str) -> None:
+        """
+        Find the local files matching files in remote_path (one of self.remote_paths)
+        and move them into its output directory
+        """
         # Dict of (new file path -> (current file path, remote file stat))
         # (computed in entirety before actually modifying any data)
         # This is a dict instead of a list of tuples so we can validate in O(n) later
         files_to_move = {}
 
-        if not os.path.isdir(self.out_path):
-            os.mkdir(self.out_path)
+        out_path = self.out_paths[remote_path]
+        if not os.path.isdir(out_path):
+            # The parent directory is only created by fef when there are multiple
+            # remote directories
+            os.makedirs(out_path)
+
+        """Find remote files that have the same size as a local file"""
+        # Dict of remote file path -> remote file stat for every remote file (or only
+        # the ones with the same size as a local file if unmatched files aren't used)
+        remote_stats = self.get_remote_files(
+            remote_path, None if self.fetch or self.seed else set(self.file_sizes)
+        )
+        remote_stats.pop(self.remote_hash_script, None)
+        # Dict of remote file path -> remote file stat
+        candidates = {
+            remote_file: stat
+            for remote_file, stat in remote_stats.items()
+            if stat.st_size in self.file_sizes
+        }
+        self.log(
+            "{} of {} listed remote files have the same size as a local file".format(
+                len(candidates), len(remote_stats)
+            )
+        )
 
         """Find matching files"""
-        for rpath, rfile in remote_files:
-            stat = self.sftp.stat(os.path.join(rpath, rfile))
-            same_size = self.file_sizes.get(stat.st_size)
-            if same_size is None:
+        for remote_file, rhash in self.remote_hash_many(list(candidates)):
+            if rhash is None:
+                self.log("Unable to hash remote file " + remote_file)
                 continue
-            # TODO the remote hashes can be computed asynchronously for all remote files
-            rhash = self.remote_hash(self.remote_path_join(rpath, rfile))
-            # TODO handle duplicate files
-            for f in same_size:
+            stat = candidates[remote_file]
+            # Use the first local file that hasn't already been matched (so local
+            # directories are used in order of priority)
+            for f in self.file_sizes[stat.st_size]:
+                if f in self.matched_local_files:
+                    continue
                 if self.local_hash(f) == rhash:
-                    self.log(
-                        "Matched file " + f + " with remote file " + rpath + "/" + rfile
-                    )
-                    new_path = self.local_path_from_remote(
-                        self.remote_path_join(rpath, rfile)
-                    )
+                    self.log("Matched file " + f + " with remote file " + remote_file)
+                    new_path = self.local_path_from_remote(remote_file, remote_path)
                     files_to_move[new_path] = (f, stat)
+                    self.matched_local_files.add(f)
+                    break
 
         """Validate file moves are internally consistent"""
         for new_path, (old_path, stat) in files_to_move.items():
@@ -461,17 +628,36 @@ with open(argv[1], 'rb') as file:
                         )
                     )
 
+        # Dict of remote file path -> (new file path, remote file stat) for remote
+        # files that weren't matched (computed before moving since the new paths of
+        # moved files are validated to not exist)
+        unmatched = {}
+        if self.fetch or self.seed:
+            for remote_file, stat in remote_stats.items():
+                new_path = self.local_path_from_remote(remote_file, remote_path)
+                if new_path not in files_to_move:
+                    unmatched[remote_file] = (new_path, stat)
+
         """Actually move the files"""
         for new_path, (old_path, stat) in files_to_move.items():
-            self.move_file(old_path, new_path)
+            with self.move_lock:
+                # Without links a file moved for another host is gone
+                if not os.path.lexists(old_path):
+                    print("Local file {} was moved by another host".format(old_path))
+                    continue
+                self.move_file(old_path, new_path)
             if self.force_newer:
                 os.utime(new_path, (stat.st_atime + 1, stat.st_mtime + 1))
 
-        """Clean up"""
-        # Remove hash script from remote
-        if self.remote_hash_script is not None:
-            self.sftp.remove(self.remote_hash_script)
-        return True
+        """Seed the files that weren't matched with similar local files"""
+        if self.seed:
+            self.seed_files(unmatched)
+
+        """Download the files that weren't matched"""
+        if self.fetch:
+            failed = self.fetch_files(unmatched)
+            if failed:
+                print("{} unmatched files could not be downloaded".format(failed))
 
     def local_hash(self, file_path: str) -> str:
         """
@@ -481,14 +667,14 @@ with open(argv[1], 'rb') as file:
         existing_hash = self.file_hashes.get(file_path)
         if existing_hash is not None:
             return existing_hash
-        # TODO handle duplicate files
-        new_hash = self.local_hash(file_path)
-        self.file_hashes[new_hash] = file_path
+        new_hash = self.hash_local_file(file_path)
+        self.file_hashes[file_path] = new_hash
         return new_hash
 
-    def remote_hash_command_line(self, path: str, file: str) -> str:
+    def remote_hash_command_line(self, path: str) -> Optional[str]:
         """
-        Hash the file at path/file on the remote server using python3 -c
+        Hash the file at path on the remote server using python3 -c
+        Returns None if the file couldn't be hashed
         """
         hash_command = """python3 -c "from hashlib import {}
 hasher = {}()
@@ -499,21 +685,21 @@ with open('{}', 'rb') as file:
             print(hasher.hexdigest())
             break
         hasher.update(data)" """.format(
-            self.hash_method,
-            self.hash_method,
-            self.remote_path_join(path, file),
-            self.remote_read_size,
+            self.hash_method, self.hash_method, path, self.remote_read_size,
         )
         _, result, _ = self.ssh.exec_command(hash_command)
-        return result.read().decode()
+        return result.read().decode().strip() or None
 
-    def local_path_from_remote(self, path: str) -> None:
+    def local_path_from_remote(self, path: str, remote_path: str = None) -> str:
         """
-        Returns the equivalent local path for path on remote
+        Returns the equivalent local path for path in remote_path (one of
+        self.remote_paths, default self.remote_path) on remote
         """
-        assert path.startswith(self.remote_path)
-        split = path[len(self.remote_path) :].split("/")[1:]
-        cur = self.out_path
+        if remote_path is None:
+            remote_path = self.remote_path
+        assert path.startswith(remote_path)
+        split = path[len(remote_path) :].split("/")[1:]
+        cur = self.out_paths[remote_path]
         for part in split:
             cur = os.path.join(cur, part)
             if not os.path.isdir(cur):
@@ -534,19 +720,215 @@ with open('{}', 'rb') as file:
                 continue
             cur = os.path.join(cur, d)
             if not os.path.isdir(cur):
-                os.mkdir(cur)
+                # Another thread may create the directory first when fetching
+                try:
+                    os.mkdir(cur)
+                except FileExistsError:
+                    pass
+
+    def get_remote_files(
+        self, remote_path: str, sizes: Optional[Set[int]] = None
+    ) -> Dict[str, RemoteStat]:
+        """
+        Returns a dict of path -> stat for the files in remote_path and its
+        subdirectories (sorted by the length of their directory ascending)
+        If sizes isn't None then only files with a size in sizes are returned, which
+        are filtered on the remote server if the hash script exists (so the other
+        files are never sent or stat-ed)
+        """
+        if self.remote_hash_script is None:
+            files = {}
+            for rpath, rfile in self.get_remote_filenames(remote_path):
+                remote_file = self.remote_path_join(rpath, rfile)
+                stat = self.sftp.stat(remote_file)
+                if sizes is None or stat.st_size in sizes:
+                    files[remote_file] = RemoteStat(
+                        stat.st_size, stat.st_mtime, stat.st_atime, stat.st_mode
+                    )
+            return files
+        stdin, stdout, _ = self.ssh.exec_command(
+            "python3 {} list {} {}".format(
+                self.remote_hash_script,
+                remote_path,
+                "all" if sizes is None else "sizes",
+            )
+        )
+        if sizes is not None:
+            encoded = encode_sizes(sizes)
+            stdin.write(str(len(encoded)).encode() + b"\n" + encoded)
+        stdin.channel.shutdown_write()
+        files = []
+        for remote_file, result in self.read_script_records(stdout):
+            size, mtime, atime, mode = result.split(" ")
+            files.append(
+                (
+                    remote_file,
+                    RemoteStat(int(size), float(mtime), float(atime), int(mode)),
+                )
+            )
+        files.sort(key=lambda f: len(f[0].rsplit("/", 1)[0]))
+        return dict(files)
 
-    def get_remote_filenames(self) -> List[Tuple[str]]:
+    def get_remote_filenames(self, remote_path: str = None) -> List[Tuple[str]]:
         """
-        Returns a list of absolute file paths and filenames in self.remote_path and
-        its subdirectories sorted by path length ascending
+        Returns a list of absolute file paths and filenames in remote_path (default
+        self.remote_path) and its subdirectories sorted by path length ascending
         """
+        if remote_path is None:
+            remote_path = self.remote_path
         # TODO handle symlinks (`find -type l`)
-        _, files, _ = self.ssh.exec_command("find " + self.remote_path + " -type f")
+        _, files, _ = self.ssh.exec_command("find " + remote_path + " -type f")
         return sorted(
             [f.rstrip().rsplit("/", 1) for f in files], key=lambda x: len(x[0])
         )
 
+    def fetch_files(self, files: Dict[str, Tuple[str, RemoteStat]]) -> int:
+        """
+        Downloads files (a dict of remote path -> (new local path, remote stat)),
+        running self.fetch_workers downloads at once over their own SFTP channels on
+        the existing connection and preserving the remote modification times
+        Returns the number of files that couldn't be downloaded
+        """
+        self.log("Downloading {} unmatched files".format(len(files)))
+        local = threading.local()
+        channels = []
+
+        def fetch_file(remote_file: str, new_path: str, stat) -> bool:
+            if not hasattr(local, "sftp"):
+                local.sftp = self.ssh.open_sftp()
+                channels.append(local.sftp)
+            self.create_path_for_file(new_path)
+            try:
+                with local.sftp.open(remote_file, "rb") as remote, open(
+                    new_path, "wb"
+                ) as file:
+                    # Request the whole file up front instead of one block at a time
+                    remote.prefetch(stat.st_size)
+                    shutil.copyfileobj(remote, file, self.remote_read_size)
+            except IOError as e:
+                print("Unable to download {} ({})".format(remote_file, e))
+                return False
+            os.chmod(new_path, stat.st_mode & 0o7777)
+            if self.force_newer:
+                os.utime(new_path, (stat.st_atime + 1, stat.st_mtime + 1))
+            else:
+                os.utime(new_path, (stat.st_atime, stat.st_mtime))
+            self.log("Downloaded remote file {} to {}".format(remote_file, new_path))
+            return True
+
+        with ThreadPoolExecutor(self.fetch_workers) as executor:
+            results = [
+                executor.submit(fetch_file, remote_file, new_path, stat)
+                for remote_file, (new_path, stat) in files.items()
+            ]
+            failed = sum(not result.result() for result in results)
+        for channel in channels:
+            channel.close()
+        return failed
+
+    def seed_files(self, files: Dict[str, Tuple[str, RemoteStat]]) -> int:
+        """
+        For each of files (a dict of remote path -> (new local path, remote stat)),
+        copies the local file with the most blocks in common with the remote file to
+        the new local path (so rsync only has to transfer the differences)
+        Returns the number of files seeded
+        """
+        if self.remote_hash_script is None:
+            print("Unable to seed unmatched files without the remote hash script")
+            return 0
+        # Files smaller than a block can only be seeded by an identical file
+        files = {
+            remote_file: (new_path, stat)
+            for remote_file, (new_path, stat) in files.items()
+            if stat.st_size >= self.seed_block_size
+        }
+        self.log("Looking for similar local files for {} files".format(len(files)))
+        local_names = {}
+        for paths in self.file_sizes.values():
+            for path in paths:
+                local_names.setdefault(os.path.basename(path), []).append(path)
+        local_sizes = sorted(self.file_sizes)
+        # Dict of local path -> set of block signatures (computed as needed)
+        local_signatures = {}
+        seeded = 0
+        for remote_file, signatures in self.run_remote_script(
+            list(files), "sig", self.seed_block_size
+        ):
+            if not signatures:
+                continue
+            new_path, stat = files[remote_file]
+            remote_signatures = {
+                signatures[i : i + SIGNATURE_LENGTH]
+                for i in range(0, len(signatures), SIGNATURE_LENGTH)
+            }
+            best_path = None
+            best_common = 0
+            for path in self.seed_candidates(
+                os.path.basename(remote_file), stat.st_size, local_names, local_sizes
+            ):
+                if path not in local_signatures:
+                    try:
+                        local = block_signatures(path, self.seed_block_size)
+                    except OSError:
+                        local = ""
+                    local_signatures[path] = {
+                        local[i : i + SIGNATURE_LENGTH]
+                        for i in range(0, len(local), SIGNATURE_LENGTH)
+                    }
+                common = len(remote_signatures & local_signatures[path])
+                if common > best_common:
+                    best_path = path
+                    best_common = common
+            if best_path is None:
+                continue
+            self.create_path_for_file(new_path)
+            shutil.copyfile(best_path, new_path)
+            seeded += 1
+            self.log(
+                "Seeded remote file {} with local file {} ({} of {} blocks in "
+                "common)".format(
+                    remote_file, best_path, best_common, len(remote_signatures)
+                )
+            )
+        return seeded
+
+    def seed_candidates(
+        self,
+        name: str,
+        size: int,
+        local_names: Dict[str, List[str]],
+        local_sizes: List[int],
+    ) -> List[str]:
+        """
+        Returns up to SEED_CANDIDATES local files that are likely to be similar to a
+        remote file called name of size size: first the local files with the same
+        name, then the local files whose size is closest to size (but no less than
+        half or more than twice it)
+        local_sizes is the sorted list of keys of self.file_sizes
+        """
+        candidates = local_names.get(name, [])[:SEED_CANDIDATES]
+        below = bisect.bisect_left(local_sizes, size) - 1
+        above = below + 1
+        while len(candidates) < SEED_CANDIDATES:
+            use_below = below >= 0 and local_sizes[below] * 2 >= size
+            use_above = above < len(local_sizes) and local_sizes[above] <= size * 2
+            if use_below and use_above:
+                use_below = size - local_sizes[below] <= local_sizes[above] - size
+            elif not use_below and not use_above:
+                break
+            if use_below:
+                paths = self.file_sizes[local_sizes[below]]
+                below -= 1
+            else:
+                paths = self.file_sizes[local_sizes[above]]
+                above += 1
+            for path in paths:
+                if len(candidates) == SEED_CANDIDATES:
+                    break
+                if path not in candidates:
+                    candidates.append(path)
+        return candidates
+
     def move_file(self, local_file_path: str, new_file_path: str) -> None:
         """
         Moves (or copies if self.copy) the file at local_file_path to new_file_path,
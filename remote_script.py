@@ -0,0 +1,249 @@
+"""
+fef: move existing files to match remote server's file structure
+Copyright (C) 2019 Alexander French (http://github.com/a8f)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+This file is uploaded to the remote server and run there with python3 (see
+FileFinder.create_hash_script) so it must only use the standard library and
+must not import anything else from fef.
+
+Usage: python3 hash.py <mode> <max workers> <mode arguments...>
+Reads NUL-delimited paths from stdin (up to an empty path or EOF) and writes
+"<result>\t<path>\0" for each path as soon as it has been processed (so not
+necessarily in the order they were given), using up to <max workers> processes
+(or one per CPU if it is 0). Files that can't be read are given a result of "-".
+The modes are:
+    hash <algorithm> <read size>: result is the hexdigest of the file
+    sig <block size>: result is block_signatures of the file
+
+Usage: python3 hash.py list <root> <all|sizes>
+Writes "<size> <mtime> <atime> <mode>\t<path>\0" for each regular file in root
+and its subdirectories. If the last argument is "sizes" then stdin starts with
+"<length>\n" followed by <length> bytes of sizes encoded by encode_sizes and only
+files with one of those sizes are written.
+"""
+
+import hashlib
+import os
+import sys
+import zlib
+from multiprocessing import Pool
+
+# Set in each worker by init_worker
+mode = None
+mode_args = None
+
+
+def init_worker(worker_mode: str, worker_mode_args: list) -> None:
+    global mode, mode_args
+    mode = worker_mode
+    mode_args = worker_mode_args
+
+
+def hash_file(path: bytes, algorithm: str, read_size: str) -> str:
+    """
+    Returns the hexdigest of the file at path using algorithm
+    """
+    hasher = hashlib.new(algorithm)
+    read_size = int(read_size)
+    with open(path, "rb") as file:
+        while True:
+            data = file.read(read_size)
+            if not data:
+                return hasher.hexdigest()
+            hasher.update(data)
+
+
+def block_signatures(path, block_size) -> str:
+    """
+    Returns the rsync-style signatures of each block_size block of the file at path
+    concatenated together, where each signature is the 8 hex digit Adler-32 checksum
+    of the block (the same weak checksum rsync rolls) followed by the first 8 hex
+    digits of its MD5 hash
+    This is also used by fef locally so both sides compute identical signatures
+    """
+    block_size = int(block_size)
+    signatures = []
+    with open(path, "rb") as file:
+        while True:
+            block = file.read(block_size)
+            if not block:
+                return "".join(signatures)
+            signatures.append(
+                "{:08x}{}".format(
+                    zlib.adler32(block), hashlib.md5(block).hexdigest()[:8]
+                )
+            )
+
+
+MODES = {"hash": hash_file, "sig": block_signatures}
+
+
+def encode_sizes(sizes) -> bytes:
+    """
+    Returns sizes (an iterable of non-negative ints) compactly encoded as the
+    zlib-compressed LEB128 varints of the differences between the sorted sizes
+    """
+    out = bytearray()
+    previous = 0
+    for size in sorted(sizes):
+        delta = size - previous
+        previous = size
+        while delta >= 0x80:
+            out.append(delta & 0x7F | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return zlib.compress(bytes(out))
+
+
+def decode_sizes(data: bytes) -> set:
+    """
+    Returns the set of sizes encoded in data by encode_sizes
+    """
+    sizes = set()
+    size = 0
+    delta = 0
+    shift = 0
+    for byte in zlib.decompress(data):
+        delta |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            size += delta
+            sizes.add(size)
+            delta = 0
+            shift = 0
+    return sizes
+
+
+def list_files(root: str, sizes) -> None:
+    """
+    Write the record for each regular file in root and its subdirectories whose size
+    is in sizes (or every file if sizes is None)
+    """
+    out = sys.stdout.buffer
+    directories = [os.fsencode(root)]
+    while directories:
+        try:
+            entries = list(os.scandir(directories.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if sizes is not None and stat.st_size not in sizes:
+                continue
+            out.write(
+                "{} {!r} {!r} {}\t".format(
+                    stat.st_size, stat.st_mtime, stat.st_atime, stat.st_mode
+                ).encode()
+                + entry.path
+                + b"\0"
+            )
+    out.flush()
+
+
+def read_sizes(stream) -> set:
+    """
+    Returns the set of sizes sent on stream as "<length>\n<encoded sizes>"
+    """
+    length = int(stream.readline())
+    return decode_sizes(stream.read(length))
+
+
+def process_file(path: bytes) -> bytes:
+    """
+    Returns the record to output for the file at path
+    """
+    try:
+        result = MODES[mode](path, *mode_args)
+    except OSError:
+        return b"-\t" + path + b"\0"
+    return result.encode() + b"\t" + path + b"\0"
+
+
+def read_paths(stream):
+    """
+    Yields NUL-delimited paths from stream as they arrive, stopping at an empty path
+    since not all SSH servers pass EOF on to the command's stdin
+    """
+    buffer = b""
+    while True:
+        data = stream.read1(2 ** 16)
+        if not data:
+            break
+        buffer += data
+        *paths, buffer = buffer.split(b"\0")
+        for path in paths:
+            if not path:
+                return
+            yield path
+    if buffer:
+        yield buffer
+
+
+def cpu_count() -> int:
+    """
+    Returns the number of CPUs this process is allowed to run on
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def process_files(files_mode: str, max_workers: int, files_mode_args: list) -> None:
+    """
+    Process the paths given on stdin with files_mode using up to max_workers
+    processes (or one per CPU if max_workers is 0)
+    """
+    workers = cpu_count()
+    if max_workers > 0:
+        workers = min(workers, max_workers)
+    paths = read_paths(sys.stdin.buffer)
+    out = sys.stdout.buffer
+    if workers == 1:
+        init_worker(files_mode, files_mode_args)
+        results = map(process_file, paths)
+        pool = None
+    else:
+        pool = Pool(workers, init_worker, (files_mode, files_mode_args))
+        results = pool.imap_unordered(process_file, paths)
+    for record in results:
+        out.write(record)
+        out.flush()
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+if __name__ == "__main__":
+    if sys.argv[1] == "list":
+        list_files(
+            sys.argv[2],
+            read_sizes(sys.stdin.buffer) if sys.argv[3] == "sizes" else None,
+        )
+    elif sys.argv[1] in MODES:
+        process_files(sys.argv[1], int(sys.argv[2]), sys.argv[3:])
+    else:
+        sys.exit("Unknown mode " + sys.argv[1])
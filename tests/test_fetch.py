@@ -0,0 +1,37 @@
+import os
+import shutil
+
+from .util import create_small_file, file_sha1
+
+
+def test_fetch_unmatched(ssh_server, file_finder):
+    file_finder.fetch = True
+    local_path = os.path.join(file_finder.local_path, "test_local_file.txt")
+    matched_hash = create_small_file(local_path)
+    shutil.copyfile(
+        local_path, os.path.join(file_finder.remote_path, "test_matched_file.txt")
+    )
+    os.mkdir(os.path.join(file_finder.remote_path, "subdir"))
+    remote_path = os.path.join(file_finder.remote_path, "subdir", "test_remote.txt")
+    unmatched_hash = create_small_file(remote_path)
+    os.utime(remote_path, (1000000000, 1000000000))
+    file_finder.run()
+    # Matched file was moved
+    moved_path = os.path.join(file_finder.out_path, "test_matched_file.txt")
+    assert file_sha1(moved_path) == matched_hash
+    assert not os.path.exists(local_path)
+    # Unmatched file was downloaded with its modification time
+    fetched_path = os.path.join(file_finder.out_path, "subdir", "test_remote.txt")
+    assert file_sha1(fetched_path) == unmatched_hash
+    assert os.stat(fetched_path).st_mtime == 1000000000
+    # Remote hash script isn't downloaded
+    assert sorted(os.listdir(file_finder.out_path)) == [
+        "subdir",
+        "test_matched_file.txt",
+    ]
+
+
+def test_no_fetch_by_default(ssh_server, file_finder):
+    create_small_file(os.path.join(file_finder.remote_path, "test_remote.txt"))
+    file_finder.run()
+    assert os.listdir(file_finder.out_path) == []
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+
+from file_finder import FileFinder
+
+from .util import create_small_file, file_sha1, new_config
+
+
+def test_multiple_local_and_remote_dirs(ssh_server):
+    config = new_config()
+    config["extra_local_dirs"] = [tempfile.mkdtemp()]
+    config["extra_remote_dirs"] = [tempfile.mkdtemp()]
+    file_finder = FileFinder(**config)
+    first_local, second_local = file_finder.local_paths
+    first_remote, second_remote = file_finder.remote_paths
+    # Same file in both local directories, so the first one should be used
+    first_hash = create_small_file(os.path.join(first_local, "first.txt"))
+    shutil.copyfile(
+        os.path.join(first_local, "first.txt"), os.path.join(second_local, "dup.txt")
+    )
+    second_hash = create_small_file(os.path.join(second_local, "second.txt"))
+    shutil.copyfile(
+        os.path.join(first_local, "first.txt"), os.path.join(first_remote, "a.txt")
+    )
+    shutil.copyfile(
+        os.path.join(second_local, "second.txt"), os.path.join(second_remote, "b.txt")
+    )
+    file_finder.run()
+    # Each remote directory gets its own output directory
+    first_out = os.path.join(config["out_dir"], os.path.basename(first_remote))
+    second_out = os.path.join(config["out_dir"], os.path.basename(second_remote))
+    assert file_finder.out_paths == {first_remote: first_out, second_remote: second_out}
+    assert file_sha1(os.path.join(first_out, "a.txt")) == first_hash
+    assert file_sha1(os.path.join(second_out, "b.txt")) == second_hash
+    assert not os.path.exists(os.path.join(first_local, "first.txt"))
+    assert os.path.exists(os.path.join(second_local, "dup.txt"))
+
+
+def test_duplicate_remote_files_use_separate_local_files(ssh_server, file_finder):
+    first_hash = create_small_file(os.path.join(file_finder.local_path, "one.txt"))
+    shutil.copyfile(
+        os.path.join(file_finder.local_path, "one.txt"),
+        os.path.join(file_finder.local_path, "two.txt"),
+    )
+    for name in ["a.txt", "b.txt"]:
+        shutil.copyfile(
+            os.path.join(file_finder.local_path, "one.txt"),
+            os.path.join(file_finder.remote_path, name),
+        )
+    file_finder.run()
+    for name in ["a.txt", "b.txt"]:
+        assert file_sha1(os.path.join(file_finder.out_path, name)) == first_hash
@@ -0,0 +1,26 @@
+import os
+import shutil
+
+from file_finder import FileFinder
+
+from .util import create_small_file, file_sha1, new_config
+
+
+def test_run_all_shares_local_index(ssh_server):
+    file_finders = [FileFinder(**new_config()) for _ in range(2)]
+    for file_finder in file_finders[1:]:
+        file_finder.local_paths = file_finders[0].local_paths
+        file_finder.symlink = True
+    file_finders[0].symlink = True
+    local_path = os.path.join(file_finders[0].local_path, "test_local_file.txt")
+    true_hash = create_small_file(local_path)
+    for file_finder in file_finders:
+        shutil.copyfile(
+            local_path, os.path.join(file_finder.remote_path, "test_remote_file.txt")
+        )
+    assert FileFinder.run_all(file_finders)
+    assert all(f.file_sizes is file_finders[0].file_sizes for f in file_finders)
+    assert list(file_finders[0].file_hashes) == [local_path]
+    for file_finder in file_finders:
+        moved_path = os.path.join(file_finder.out_path, "test_remote_file.txt")
+        assert file_sha1(moved_path) == true_hash
@@ -0,0 +1,43 @@
+import os
+
+from .util import file_sha1
+
+
+def write_blocks(path: str, blocks: list) -> None:
+    with open(path, "wb") as file:
+        for block in blocks:
+            file.write(block)
+
+
+def test_seed_similar_file(ssh_server, file_finder):
+    file_finder.seed = True
+    file_finder.seed_block_size = 1024
+    blocks = [os.urandom(1024) for _ in range(8)]
+    local_path = os.path.join(file_finder.local_path, "test_local_file.bin")
+    write_blocks(local_path, blocks)
+    # Remote file is the local file with one block changed and another appended
+    blocks[3] = os.urandom(1024)
+    write_blocks(
+        os.path.join(file_finder.remote_path, "test_remote_file.bin"),
+        blocks + [os.urandom(1024)],
+    )
+    file_finder.run()
+    seeded_path = os.path.join(file_finder.out_path, "test_remote_file.bin")
+    assert file_sha1(seeded_path) == file_sha1(local_path)
+    # The local file is copied, not moved
+    assert not os.path.islink(local_path)
+
+
+def test_no_seed_for_different_file(ssh_server, file_finder):
+    file_finder.seed = True
+    file_finder.seed_block_size = 1024
+    write_blocks(
+        os.path.join(file_finder.local_path, "test_local_file.bin"),
+        [os.urandom(1024) for _ in range(8)],
+    )
+    write_blocks(
+        os.path.join(file_finder.remote_path, "test_remote_file.bin"),
+        [os.urandom(1024) for _ in range(8)],
+    )
+    file_finder.run()
+    assert os.listdir(file_finder.out_path) == []
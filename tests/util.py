@@ -24,11 +24,18 @@ default_config = {
     "verbosity": 2,
     "clean": False,
     "hash_function": "sha1",
+    "remote_workers": 0,
     "copy": False,
     "req_existing_hostkey": False,
     "no_local_keys": False,
     "force_newer": False,
     "log_file": "stdout",
+    "fetch": False,
+    "fetch_workers": 8,
+    "seed": False,
+    "seed_block_size": 2 ** 16,
+    "extra_local_dirs": None,
+    "extra_remote_dirs": None,
 }
 
 